@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import collections
+import datetime
+import functools
 import glob
+import http.server
+import json
 import shutil # for rmtree (= "rm -Rf")
 import subprocess # for git (note: in the future, we may want to use GitPython instead)
 import sys
+import urllib.parse
 
 if len(sys.argv) < 2:
-    print('Usage: ./count_lines.py <vgc-root-dir> [--historical [numCommits]]')
+    print('Usage: ./count_lines.py <vgc-root-dir> [--historical [numCommits] | --attribution [numCommits] | --serve [port]]')
     exit()
 
 # Each line in source files is classified into one of the following categories:
@@ -70,6 +77,15 @@ class LineCounts:
         self.qssWrap = 0
         self.qssCode = 0
 
+# Increments the counters of the given LineCounts, where prefix is the
+# language part of the counter names (e.g., 'cpp') and categories is an
+# iterable of line categories (e.g., 'Code').
+#
+def addCounts(count, prefix, categories):
+    for category, n in collections.Counter(categories).items():
+        name = prefix + category
+        setattr(count, name, getattr(count, name) + n)
+
 # The argument \p within tells whether we are starting this line within a C-Style
 # comment, i.e., the characters "/*" were found in one of the previous lines
 # with no matching "*/" found yet.
@@ -109,158 +125,179 @@ def handleCStyleComment(line, within):
                 i += 1
     return hasCode, within
 
+# Each of the following *Classify() functions takes an iterable over the lines
+# of a file, and yields the category of each line as one of the strings
+# 'Blank', 'Legal', 'Comment', 'Doc', 'Test', 'Wrap', or 'Code'.
+#
+# The corresponding *Count() functions add these categories to a LineCounts.
+
 # C++ has // and /* comments
+def cppClassify(lines, isTestDir = False, isWrapDir = False):
+    isLegal = False
+    within = False
+    for line in lines:
+        line = line.strip()
+
+        # Handle C-style comments
+        hasCode, within = handleCStyleComment(line, within)
+
+        # Handle legal comments
+        if (line.startswith('// Copyright')
+              or line.startswith('* Copyright')    # For embedded third-party code (e.g., see vgc/core/mat4d.cpp)
+              or line.startswith('/* Copyright')): # For embedded third-party code
+            isLegal = True
+        elif (isLegal and not (
+                line.startswith('//')
+                or line.startswith('*'))): # For embedded third-party code
+            isLegal = False
+
+        # Dispatch
+        if isLegal:
+            yield 'Legal'
+        elif not line:
+            yield 'Blank'
+        elif line.startswith('///') or line.startswith('/**'): # For Doxygen within multiline macros (e.g., see vgc/core/object.h)
+            yield 'Doc'
+        elif line.startswith('//') or not hasCode:
+            yield 'Comment'
+        elif isTestDir:
+            yield 'Test'
+        elif isWrapDir:
+            yield 'Wrap'
+        else:
+            yield 'Code'
+
 def cppCount(filepath, count, isTestDir = False, isWrapDir = False):
     with open(filepath, 'r') as handle:
-        isLegal = False
-        within = False
-        for line in handle:
-            line = line.strip()
-
-            # Handle C-style comments
-            hasCode, within = handleCStyleComment(line, within)
-
-            # Handle legal comments
-            if (line.startswith('// Copyright')
-                  or line.startswith('* Copyright')    # For embedded third-party code (e.g., see vgc/core/mat4d.cpp)
-                  or line.startswith('/* Copyright')): # For embedded third-party code
-                isLegal = True
-            elif (isLegal and not (
-                    line.startswith('//')
-                    or line.startswith('*'))): # For embedded third-party code
-                isLegal = False
-
-            # Dispatch
-            if isLegal:
-                count.cppLegal += 1
-            elif not line:
-                count.cppBlank += 1
-            elif line.startswith('///') or line.startswith('/**'): # For Doxygen within multiline macros (e.g., see vgc/core/object.h)
-                count.cppDoc += 1
-            elif line.startswith('//') or not hasCode:
-                count.cppComment += 1
-            elif isTestDir:
-                count.cppTest += 1
-            elif isWrapDir:
-                count.cppWrap += 1
-            else:
-                count.cppCode += 1
+        addCounts(count, 'cpp', cppClassify(handle, isTestDir, isWrapDir))
 
 # Python has # comments
+def pyClassify(lines, isTestDir = False, isWrapDir = False):
+    isLegal = False
+    for line in lines:
+        line = line.lstrip()
+
+        # Handle legal comments
+        if line.startswith('# Copyright'):
+            isLegal = True
+        elif isLegal and not line.startswith('#'):
+            isLegal = False
+
+        # Dispatch
+        if isLegal:
+            yield 'Legal'
+        elif not line:
+            yield 'Blank'
+        elif line.startswith('#'):
+            yield 'Comment'
+        elif isTestDir:
+            yield 'Test'
+        elif isWrapDir:
+            yield 'Wrap'
+        else:
+            yield 'Code'
+
 def pyCount(filepath, count, isTestDir = False, isWrapDir = False):
     with open(filepath, 'r') as handle:
-        isLegal = False
-        for line in handle:
-            line = line.lstrip()
-
-            # Handle legal comments
-            if line.startswith('# Copyright'):
-                isLegal = True
-            elif isLegal and not line.startswith('#'):
-                isLegal = False
-
-            # Dispatch
-            if isLegal:
-                count.pyLegal += 1
-            elif not line:
-                count.pyBlank += 1
-            elif line.startswith('#'):
-                count.pyComment += 1
-            elif isTestDir:
-                count.pyTest += 1
-            elif isWrapDir:
-                count.pyWrap += 1
-            else:
-                count.pyCode += 1
+        addCounts(count, 'py', pyClassify(handle, isTestDir, isWrapDir))
 
 # CMake has # comments
+def cmakeClassify(lines, isTestDir = False, isWrapDir = False):
+    isLegal = False
+    for line in lines:
+        line = line.lstrip()
+
+        # Handle legal comments
+        if line.startswith('# Copyright'):
+            isLegal = True
+        elif isLegal and not line.startswith('#'):
+            isLegal = False
+
+        # Dispatch
+        if isLegal:
+            yield 'Legal'
+        elif not line:
+            yield 'Blank'
+        elif line.startswith('#'):
+            yield 'Comment'
+        elif isTestDir:
+            yield 'Test'
+        elif isWrapDir:
+            yield 'Wrap'
+        else:
+            yield 'Code'
+
 def cmakeCount(filepath, count, isTestDir = False, isWrapDir = False):
     with open(filepath, 'r') as handle:
-        isLegal = False
-        for line in handle:
-            line = line.lstrip()
-
-            # Handle legal comments
-            if line.startswith('# Copyright'):
-                isLegal = True
-            elif isLegal and not line.startswith('#'):
-                isLegal = False
-
-            # Dispatch
-            if isLegal:
-                count.cmakeLegal += 1
-            elif not line:
-                count.cmakeBlank += 1
-            elif line.startswith('#'):
-                count.cmakeComment += 1
-            elif isTestDir:
-                count.cmakeTest += 1
-            elif isWrapDir:
-                count.cmakeWrap += 1
-            else:
-                count.cmakeCode += 1
+        addCounts(count, 'cmake', cmakeClassify(handle, isTestDir, isWrapDir))
 
 # GLSL has // and /* comments
+def glslClassify(lines, isTestDir = False, isWrapDir = False):
+    isLegal = False
+    within = False
+    for line in lines:
+        line = line.lstrip()
+
+        # Handle C-style comments
+        hasCode, within = handleCStyleComment(line, within)
+
+        # Handle legal comments
+        if line.startswith('// Copyright'):
+            isLegal = True
+        elif isLegal and not line.startswith('//'):
+            isLegal = False
+
+        # Dispatch
+        if isLegal:
+            yield 'Legal'
+        elif not line:
+            yield 'Blank'
+        elif line.startswith('///'):
+            yield 'Doc'
+        elif line.startswith('//') or not hasCode:
+            yield 'Comment'
+        elif isTestDir:
+            yield 'Test'
+        elif isWrapDir:
+            yield 'Wrap'
+        else:
+            yield 'Code'
+
 def glslCount(filepath, count, isTestDir = False, isWrapDir = False):
     with open(filepath, 'r') as handle:
-        isLegal = False
-        within = False
-        for line in handle:
-            line = line.lstrip()
-
-            # Handle C-style comments
-            hasCode, within = handleCStyleComment(line, within)
-
-            # Handle legal comments
-            if line.startswith('// Copyright'):
-                isLegal = True
-            elif isLegal and not line.startswith('//'):
-                isLegal = False
-
-            # Dispatch
-            if isLegal:
-                count.glslLegal += 1
-            elif not line:
-                count.glslBlank += 1
-            elif line.startswith('///'):
-                count.glslDoc += 1
-            elif line.startswith('//') or not hasCode:
-                count.glslComment += 1
-            elif isTestDir:
-                count.glslTest += 1
-            elif isWrapDir:
-                count.glslWrap += 1
-            else:
-                count.glslCode += 1
+        addCounts(count, 'glsl', glslClassify(handle, isTestDir, isWrapDir))
 
 # Qt stylesheets have /* comments
+def qssClassify(lines, isTestDir = False, isWrapDir = False):
+    isLegal = False
+    within = False
+    for line in lines:
+        line = line.lstrip()
+
+        # Handle C-style comments
+        hasCode, within = handleCStyleComment(line, within)
+
+        # Handle legal comments
+        if line.startswith('/* Copyright'):
+            isLegal = True
+        elif isLegal and not line.startswith('*'):
+            isLegal = False
+
+        # Dispatch
+        if not line:
+            yield 'Blank'
+        elif not hasCode:
+            yield 'Comment'
+        elif isTestDir:
+            yield 'Test'
+        elif isWrapDir:
+            yield 'Wrap'
+        else:
+            yield 'Code'
+
 def qssCount(filepath, count, isTestDir = False, isWrapDir = False):
     with open(filepath, 'r') as handle:
-        isLegal = False
-        within = False
-        for line in handle:
-            line = line.lstrip()
-
-            # Handle C-style comments
-            hasCode, within = handleCStyleComment(line, within)
-
-            # Handle legal comments
-            if line.startswith('/* Copyright'):
-                isLegal = True
-            elif isLegal and not line.startswith('*'):
-                isLegal = False
-
-            # Dispatch
-            if not line:
-                count.qssBlank += 1
-            elif not hasCode:
-                count.qssComment += 1
-            elif isTestDir:
-                count.qssTest += 1
-            elif isWrapDir:
-                count.qssWrap += 1
-            else:
-                count.qssCode += 1
+        addCounts(count, 'qss', qssClassify(handle, isTestDir, isWrapDir))
 
 def dirCount(dir, count):
     isTestDir = False
@@ -410,10 +447,21 @@ def endCsv(s):
 def printCsv(s):
     printInline(s)
 
-def printCountOneLine(date, count):
+# Quotes the given string so that it can be printed as a single CSV value,
+# even if it contains commas or quotes.
+#
+def csvQuote(s):
+    if ',' in s or '"' in s:
+        return '"' + s.replace('"', '""') + '"'
+    else:
+        return s
+
+def printCountOneLine(date, count, author = None):
     csv = Csv()
 
     csv.printValue(date)
+    if author is not None:
+        csv.printValue(csvQuote(author))
 
     totalBlank = count.cppBlank + count.pyBlank + count.cmakeBlank + count.glslBlank + count.qssBlank
     totalLegal = count.cppLegal + count.pyLegal + count.cmakeLegal + count.glslLegal + count.qssLegal
@@ -479,11 +527,13 @@ def printCountOneLine(date, count):
 
     csv.printNewline()
 
-def printCountOneLineHeader():
+def printCountOneLineHeader(withAuthor = False):
 
     csv = Csv()
 
     csv.printValue("Commit date/time")
+    if withAuthor:
+        csv.printValue("Author")
 
     csv.printValue("Total")
     csv.printValue("Blank")
@@ -587,10 +637,633 @@ def printHistoricalCount(rootDir):
     if os.path.isdir(tmpDir):
         shutil.rmtree(tmpDir)
 
+# Per-author line attribution
+# ---------------------------
+#
+# The --attribution mode computes, for each commit, how many lines of each
+# category are owned by each author, where the owner of a line is the author
+# of the commit that last added or modified it (similar to `git blame`).
+#
+# Running `git blame` on every file at every commit would be way too slow, so
+# instead we walk the history from the first commit to HEAD, and update line
+# ownership incrementally based on the hunks of each commit's diff. The
+# category of each line is obtained by running the *Classify() functions on
+# the new content of modified files, which is cached per blob.
+#
+# Note: We only walk the first parent of merge commits. The lines brought
+#       by a merge are attributed to their authors on the merged branch by
+#       running `git blame` on these lines only (see applyCommit()).
+
+# Returns a pair (prefix, classify) where prefix is the language part of the
+# LineCounts counter names for the given file, and classify is the function
+# to use to classify its lines. Returns None if this file is not counted.
+#
+def getClassifier(filepath):
+    if filepath.endswith(".h") or filepath.endswith(".cpp"):
+        return ('cpp', cppClassify)
+    if filepath.endswith(".py"):
+        return ('py', pyClassify)
+    if filepath.endswith("CMakeLists.txt"):
+        return ('cmake', cmakeClassify)
+    if filepath.endswith(".glsl"):
+        return ('glsl', glslClassify)
+    if filepath.endswith(".qss"):
+        return ('qss', qssClassify)
+    return None
+
+# Returns whether the given path, relative to the root of the repository, is
+# counted by getCurrentCount(), and if so, whether it is in a test and/or
+# wrap dir (same as in dirCount()).
+#
+def getPathInfo(path):
+    dirs = path.split('/')[:-1]
+    isCounted = path == 'CMakeLists.txt' or (dirs != [] and dirs[0] in ('apps', 'cmake', 'libs'))
+    return isCounted, 'tests' in dirs, 'wraps' in dirs
+
+# Reads blobs from the git repository using a single long-running
+# `git cat-file --batch` process.
+#
+class BlobReader:
+    def __init__(self, rootDir):
+        self.process = subprocess.Popen(
+            ["git", "cat-file", "--batch"], cwd=rootDir,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, blob):
+        self.process.stdin.write(blob.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) < 3 or header[1] != b'blob':
+            return b''
+        size = int(header[2])
+        data = self.process.stdout.read(size)
+        self.process.stdout.read(1) # Trailing newline
+        return data
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+# Returns the lines of the given blob content, split the same way as git
+# counts lines in diffs, which is required to keep line ownership in sync
+# with diff hunks. Each line keeps its trailing '\n', and '\r\n' endings
+# are converted to '\n', like when iterating over a file opened in text mode.
+#
+# Note: Unlike text mode, a lone '\r' is not considered a line ending, so
+#       for files using old Mac-style line endings, the counts computed from
+#       blobs (--attribution and --serve) differ from the counts computed from
+#       files (default mode and --historical).
+#
+def splitBlobLines(data):
+    text = data.decode('utf8', errors='replace').replace('\r\n', '\n')
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+# Ownership and category of each line of a file at a given commit.
+#
+# The categories are None for files which are not classified, e.g., a
+# README. We still need to keep track of who owns their lines, in case they
+# are later renamed to a classified file. The authors are None if unknown,
+# e.g., for binary files.
+#
+class FileAttribution:
+    def __init__(self, path, blob, authors, categories):
+        self.path = path
+        self.blob = blob
+        self.authors = authors
+        self.categories = categories
+
+# Changes to a file in a `git diff-tree` patch.
+#
+class FileDiff:
+    def __init__(self, path):
+        self.oldPath = path
+        self.newPath = path
+        self.newBlob = None
+        self.isBinary = False
+        self.hunks = [] # list of (oldStart, oldLength, newStart, newLength)
+
+class AttributionState:
+    def __init__(self, rootDir):
+        self.blobReader = BlobReader(rootDir)
+        self.files = {}  # path -> FileAttribution
+        self.counts = {} # author -> LineCounts
+
+        # Cache of line categories per blob, so that files which come back
+        # to a previous content (e.g., reverts) or which are copied or moved
+        # around do not have to be read and classified again.
+        self.classifyBlob = functools.lru_cache(maxsize=4096)(self.classifyBlob)
+
+    def classifyBlob(self, blob, classify, isTestDir, isWrapDir):
+        lines = splitBlobLines(self.blobReader.read(blob))
+        return tuple(classify(lines, isTestDir, isWrapDir))
+
+    def getCategories(self, blob, path):
+        classify = getClassifier(path)[1]
+        (_, isTestDir, isWrapDir) = getPathInfo(path)
+        return self.classifyBlob(blob, classify, isTestDir, isWrapDir)
+
+    # Adds (delta = 1) or removes (delta = -1) the lines of the given file to
+    # the per-author counts.
+    #
+    def addFileCounts(self, file, delta):
+        if file.categories is None or not getPathInfo(file.path)[0]:
+            return
+        prefix = getClassifier(file.path)[0]
+        for author, category in zip(file.authors, file.categories):
+            count = self.counts.get(author)
+            if count is None:
+                count = LineCounts()
+                self.counts[author] = count
+            name = prefix + category
+            setattr(count, name, getattr(count, name) + delta)
+
+    # Updates the state given the changes to one file in the given commit.
+    #
+    # Added lines are attributed to the given author, unless lineAuthors is
+    # given, in which case it maps line numbers in the new file to authors.
+    #
+    def applyDiff(self, commit, author, diff, lineAuthors = None):
+        oldFile = self.files.pop(diff.oldPath, None) if diff.oldPath else None
+        if oldFile:
+            self.addFileCounts(oldFile, -1)
+        if not diff.newPath:
+            return
+
+        # Get the new owners of each line
+        if diff.isBinary:
+            authors = None
+        elif oldFile:
+            authors = oldFile.authors
+        elif diff.oldPath is None:
+            authors = [] # New file
+        else:
+            authors = None # Should not happen since we track all files
+        if authors is not None:
+            # Apply hunks in reverse order so that the line numbers of the
+            # remaining hunks, which refer to the old file, are still valid.
+            for (oldStart, oldLength, newStart, newLength) in reversed(diff.hunks):
+                start = oldStart - 1 if oldLength > 0 else oldStart
+                if lineAuthors:
+                    newAuthors = [lineAuthors.get(newStart + i, author) for i in range(newLength)]
+                else:
+                    newAuthors = [author] * newLength
+                authors[start:start + oldLength] = newAuthors
+
+        # Get the new blob. This is unchanged for pure renames and mode
+        # changes, and in the unlikely case where we don't know the old
+        # blob, we let `git cat-file` resolve it from the commit and path.
+        blob = diff.newBlob or (oldFile.blob if oldFile else commit + ':' + diff.newPath)
+
+        # Get the category of each line
+        categories = None
+        if getClassifier(diff.newPath):
+            categories = self.getCategories(blob, diff.newPath)
+            if authors is None:
+                authors = [lineAuthors.get(i + 1, author) if lineAuthors else author
+                           for i in range(len(categories))]
+            elif len(authors) != len(categories):
+                raise RuntimeError(
+                    "Line ownership of " + diff.newPath + " out of sync at commit " + commit + ": " +
+                    str(len(authors)) + " owners for " + str(len(categories)) + " lines")
+
+        newFile = FileAttribution(diff.newPath, blob, authors, categories)
+        self.files[diff.newPath] = newFile
+        self.addFileCounts(newFile, 1)
+
+    # Returns the sum of the counts of all authors.
+    #
+    def getTotalCount(self):
+        total = LineCounts()
+        for count in self.counts.values():
+            for name, value in vars(count).items():
+                setattr(total, name, getattr(total, name) + value)
+        return total
+
+    def close(self):
+        self.blobReader.close()
+
+# Reverts the C-style quoting that git uses for paths containing special
+# characters, e.g., "\"a/caf\\303\\251.h\"" becomes "a/café.h". Returns
+# a pair (path, rest) where rest is what follows the path in the given
+# string. If the path is not quoted, it is assumed to end at the first tab.
+#
+cEscapes = {'a': 7, 'b': 8, 't': 9, 'n': 10, 'v': 11, 'f': 12, 'r': 13, '"': 34, '\\': 92}
+
+def unquotePath(s):
+    if not s.startswith('"'):
+        (path, _, rest) = s.partition('\t')
+        return (path, rest)
+    data = bytearray()
+    i = 1
+    while i < len(s) and s[i] != '"':
+        if s[i] == '\\' and s[i + 1] in cEscapes:
+            data.append(cEscapes[s[i + 1]])
+            i += 2
+        elif s[i] == '\\':
+            data.append(int(s[i + 1:i + 4], 8))
+            i += 4
+        else:
+            data += s[i].encode('utf8')
+            i += 1
+    return (data.decode('utf8', errors='replace'), s[i + 1:])
+
+# Returns the path of a "--- a/path" or "+++ b/path" diff header line, or
+# None for /dev/null. Note that git appends a tab to these lines when the
+# path contains a space, which unquotePath() takes care of.
+#
+def parseDiffHeaderPath(line):
+    if line[4:] == '/dev/null':
+        return None
+    return unquotePath(line[4:])[0][2:]
+
+# Returns the path of a "diff --git a/path b/path" line. This is only used for
+# sections without "---" and "+++" lines, e.g., empty new files, in which
+# case both paths are equal unless this is a rename, whose paths are then
+# given by "rename from/to" lines.
+#
+def parseDiffGitPath(line):
+    rest = line[len('diff --git '):]
+    if rest.startswith('"'):
+        return unquotePath(rest)[0][2:]
+    else:
+        return rest[2:2 + (len(rest) - 5) // 2]
+
+# Returns a dictionary mapping each line number in the given ranges of the
+# given file to the author of the line, as per `git blame`. The ranges are
+# given as (start, length) pairs, or None for the whole file.
+#
+def blameLines(rootDir, commit, path, ranges = None):
+    args = []
+    for (start, length) in ranges or []:
+        args += ["-L", str(start) + ",+" + str(length)]
+    output = subprocess.check_output(
+        ["git", "blame", "--line-porcelain"] + args + [commit, "--", path],
+        cwd=rootDir).decode('utf8', errors='replace')
+
+    # Each line is given as a "<hash> <old line> <new line>" header, followed
+    # by metadata such as "author <name>", followed by the tab-prefixed line.
+    lineAuthors = {}
+    isHeader = True
+    for line in output.split('\n'):
+        if isHeader:
+            if line:
+                lineNumber = int(line.split(' ')[2])
+                isHeader = False
+        elif line.startswith('\t'):
+            lineAuthors[lineNumber] = author
+            isHeader = True
+        elif line.startswith('author '):
+            author = line[len('author '):]
+    return lineAuthors
+
+# Parses the patch of the given commit and applies it to the given state.
+#
+# For merge commits, the patch is computed against the first parent, and the
+# lines it adds typically come from commits of the merged branch. So instead
+# of attributing these lines to the author of the merge commit, we run
+# `git blame` on them, which is much cheaper than running it on every file.
+#
+def applyCommit(state, rootDir, commit, parents, author):
+    if parents:
+        revisions = [parents[0], commit]
+    else:
+        revisions = ["--root", commit]
+    patch = subprocess.check_output(
+        ["git", "-c", "core.quotePath=false", "diff-tree", "-r", "-M", "-p", "-U0",
+         "--full-index", "--no-commit-id", "--no-ext-diff"] + revisions,
+        cwd=rootDir).decode('utf8', errors='replace')
+
+    diffs = []
+    diff = None
+    for line in patch.split('\n'):
+        if line.startswith('diff --git '):
+            diff = FileDiff(parseDiffGitPath(line))
+            diffs.append(diff)
+            inHunks = False
+        elif diff is None:
+            continue
+        elif line.startswith('@@ '):
+            inHunks = True
+            (old, new) = line.split(' ')[1:3]
+            (oldStart, _, oldLength) = old[1:].partition(',')
+            (newStart, _, newLength) = new[1:].partition(',')
+            diff.hunks.append((int(oldStart), int(oldLength or 1), int(newStart), int(newLength or 1)))
+        elif inHunks:
+            continue
+        elif line.startswith('rename from '):
+            diff.oldPath = unquotePath(line[len('rename from '):])[0]
+        elif line.startswith('rename to '):
+            diff.newPath = unquotePath(line[len('rename to '):])[0]
+        elif line.startswith('new file mode'):
+            diff.oldPath = None
+        elif line.startswith('deleted file mode'):
+            diff.newPath = None
+        elif line.startswith('index '):
+            newBlob = line.split(' ')[1].split('..')[1]
+            diff.newBlob = None if newBlob.strip('0') == '' else newBlob
+        elif line.startswith('--- '):
+            diff.oldPath = parseDiffHeaderPath(line)
+        elif line.startswith('+++ '):
+            diff.newPath = parseDiffHeaderPath(line)
+        elif line.startswith('Binary files ') or line.startswith('GIT binary patch'):
+            diff.isBinary = True
+
+    isMerge = len(parents) > 1
+    for diff in diffs:
+        lineAuthors = None
+        if isMerge and diff.newPath and getClassifier(diff.newPath):
+            if diff.isBinary or (diff.oldPath and diff.oldPath not in state.files):
+                ranges = None # Unknown owners: blame the whole file
+            else:
+                ranges = [(newStart, newLength) for (_, _, newStart, newLength) in diff.hunks if newLength > 0]
+            if ranges is None or ranges:
+                lineAuthors = blameLines(rootDir, commit, diff.newPath, ranges)
+        state.applyDiff(commit, author, diff, lineAuthors)
+
+# Returns the first-parent commits in the given revision range, from oldest
+# to newest, as a list of tuples (commit, parents, author, date, timestamp),
+# where parents is the list of parent commits, date is an ISO 8601 string such
+# as "2018-08-08T15:40:31+0200", and timestamp is the same date as a Unix
+# timestamp.
+#
+def getFirstParentCommits(rootDir, revisions = "HEAD"):
+    log = subprocess.check_output(
+        ["git", "log", "--first-parent", "--reverse", "--date=iso",
+         "--format=format:%H %P%x00%aN%x00%ad%x00%at", revisions],
+        cwd=rootDir).decode('utf8')
+    commits = []
+    for line in log.split('\n') if log else []:
+        (hashes, author, commitDatetime, timestamp) = line.split('\0')
+        hashes = hashes.split()
+        commitDatetime = commitDatetime.replace(" ", "T", 1)
+        commitDatetime = commitDatetime.replace(" ", "", 1)
+        commits.append((hashes[0], hashes[1:], author, commitDatetime, int(timestamp)))
+    return commits
+
+def printAttributionCount(rootDir):
+    maxCommits = -1
+    if len(sys.argv) > 3:
+        maxCommits = int(sys.argv[3])
+
+    commits = getFirstParentCommits(rootDir)
+
+    printCountOneLineHeader(withAuthor = True)
+
+    state = AttributionState(rootDir)
+    for i, (commit, parents, author, commitDatetime, timestamp) in enumerate(commits):
+        applyCommit(state, rootDir, commit, parents, author)
+
+        # Only print the last maxCommits commits. Note that we still need to
+        # process all the previous commits to know who owns which line.
+        if maxCommits != -1 and len(commits) - i > maxCommits:
+            continue
+
+        for author in sorted(state.counts):
+            count = state.counts[author]
+            if any(vars(count).values()):
+                printCountOneLine(commitDatetime, count, author)
+
+    state.close()
+
+# Query server
+# ------------
+#
+# The --serve mode starts a local HTTP server which keeps the total line
+# counts of all first-parent commits in memory, so that dashboards can query
+# them without redoing a full --historical run each time. The history is
+# computed incrementally in the same way as for --attribution, and is
+# updated whenever HEAD moves, either by processing only the new commits if
+# HEAD moved forward, or by recomputing everything if history was rewritten.
+#
+# Example query:
+#
+#   GET /counts?since=2020-01-01&until=2021-01-01&language=cpp,py&category=Code,Doc
+#
+# All parameters are optional. The since/until parameters are ISO 8601 dates
+# or date-times (UTC if no offset is given) or Unix timestamps, and are both
+# inclusive: until=2021-01-01 includes all the commits of that day. The
+# language and category parameters are comma-separated lists of:
+#
+#   language: total, cpp, py, cmake, glsl, qss
+#   category: Total, Blank, Legal, Comment, Doc, Test, Wrap, Code
+#
+# The response is a JSON object such as:
+#
+#   {"head": "<hash>", "rows": [{"commit": "<hash>", "date": "2020-01-02T10:00:00+0100",
+#                                "counts": {"cpp": {"Code": 1234, "Doc": 56}, ...}}, ...]}
+#
+# Results are cached per query and HEAD, so repeated queries are instant.
+
+countLanguages = ['cpp', 'py', 'cmake', 'glsl', 'qss']
+countCategories = ['Blank', 'Legal', 'Comment', 'Doc', 'Test', 'Wrap', 'Code']
+
+def getCountValue(count, language, category):
+    languages = countLanguages if language == 'total' else [language]
+    categories = countCategories if category == 'Total' else [category]
+    return sum(getattr(count, l + c) for l in languages for c in categories)
+
+# Parses an ISO 8601 date or date-time into a Unix timestamp, e.g.:
+#
+#   2018-08-08
+#   2018-08-08T15:40:31Z
+#   2018-08-08T15:40:31+0200  (same format as the dates returned by /counts)
+#   2018-08-08T15:40:31+02:00
+#
+# The date-time is assumed to be UTC if no offset is given. Note that the
+# '+' of an offset becomes a space if not URL-encoded, which is accepted.
+# Unix timestamps are also accepted as is.
+#
+# If endOfDay is True and only a date is given, then the returned timestamp
+# is the last second of this day instead of the first one.
+#
+def parseTimestamp(s, endOfDay = False):
+    s = s.strip()
+    if re.fullmatch(r'-?\d+(\.\d+)?', s):
+        return float(s)
+    m = re.fullmatch(r'(\d{4}-\d{2}-\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2}))?(?:\.\d+)?)?(Z|[+\- ]\d{2}:?\d{2})?', s)
+    if not m:
+        raise ValueError("expected an ISO 8601 date or a Unix timestamp, got '" + s + "'")
+    (date, hours, minutes, seconds, offset) = m.groups()
+    d = datetime.datetime.strptime(date, '%Y-%m-%d').replace(
+        hour=int(hours or 0), minute=int(minutes or 0), second=int(seconds or 0),
+        tzinfo=datetime.timezone.utc)
+    offsetSeconds = 0
+    if offset and offset != 'Z':
+        digits = offset[1:].replace(':', '')
+        offsetSeconds = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+        if offset[0] == '-':
+            offsetSeconds = -offsetSeconds
+    if endOfDay and hours is None:
+        offsetSeconds -= 24 * 3600 - 1
+    return d.timestamp() - offsetSeconds
+
+class CountHistory:
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+        self.state = None
+        self.stateHead = None # Commit up to which self.state was computed
+        self.head = None
+        self.rows = [] # list of (commit, date, timestamp, LineCounts or None)
+        self.query = functools.lru_cache(maxsize=256)(self.query)
+
+    # Processes the commits since the last update, if HEAD moved.
+    #
+    # There is one row per first-parent commit up to the head. If HEAD moves
+    # back to one of these commits (e.g., after a reset or checkout), the
+    # rows after it are simply dropped. In this case, the state is not
+    # rewound, but recomputed only if HEAD later moves forward again.
+    #
+    # The head is updated after each processed commit. If processing a commit
+    # fails, the state is partially modified so it cannot be trusted anymore,
+    # but the rows before this commit can: the next update recomputes the
+    # state up to the head, then starts from where this update stopped.
+    #
+    def update(self):
+        head = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=self.rootDir).decode('utf8').strip()
+        if head == self.head:
+            return
+
+        # HEAD moved backward
+        for i, row in enumerate(self.rows):
+            if row[0] == head:
+                self.rows = self.rows[:i + 1]
+                self.head = head
+                return
+
+        # HEAD moved forward, or history was rewritten
+        commits = None
+        if self.head is not None:
+            commits = getFirstParentCommits(self.rootDir, self.head + ".." + head)
+            if not commits or commits[0][1][:1] != [self.head]:
+                commits = None
+        if commits is None:
+            self.head = None
+            self.rows = []
+            self.resetState()
+            commits = getFirstParentCommits(self.rootDir, head)
+        elif self.stateHead != self.head:
+            self.resetState()
+            for (commit, parents, author, commitDatetime, timestamp) in getFirstParentCommits(self.rootDir, self.head):
+                self.applyCommit(commit, parents, author)
+        for (commit, parents, author, commitDatetime, timestamp) in commits:
+            self.applyCommit(commit, parents, author)
+
+            # Same as --historical, which stops at the first commit without
+            # 'CMakeLists.txt' when going back in time. See query().
+            count = self.state.getTotalCount() if 'CMakeLists.txt' in self.state.files else None
+            self.rows.append((commit, commitDatetime, timestamp, count))
+            self.head = commit
+
+    def resetState(self):
+        if self.state:
+            self.state.close()
+        self.state = AttributionState(self.rootDir)
+        self.stateHead = None
+
+    def applyCommit(self, commit, parents, author):
+        self.stateHead = None
+        applyCommit(self.state, self.rootDir, commit, parents, author)
+        self.stateHead = commit
+
+    # Returns the JSON response to the given query, as bytes. The head
+    # argument is not used other than as part of the cache key, so that
+    # cached results are not reused after HEAD moves.
+    #
+    def query(self, head, since, until, languages, categories):
+        rows = []
+        for (commit, commitDatetime, timestamp, count) in self.rows:
+            if count is None:
+                rows = [] # No 'CMakeLists.txt' at this commit
+                continue
+            if (since is not None and timestamp < since) or (until is not None and timestamp > until):
+                continue
+            counts = {}
+            for language in languages:
+                counts[language] = {c: getCountValue(count, language, c) for c in categories}
+            rows.append({"commit": commit, "date": commitDatetime, "counts": counts})
+        return json.dumps({"head": head, "rows": rows}).encode('utf8')
+
+    def close(self):
+        if self.state:
+            self.state.close()
+
+class CountRequestHandler(http.server.BaseHTTPRequestHandler):
+    history = None # Set by serveCounts()
+
+    def sendJson(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendError(self, status, message):
+        self.sendJson(status, json.dumps({"error": message}).encode('utf8'))
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/counts':
+            self.sendError(404, "Unknown path " + url.path)
+            return
+        params = urllib.parse.parse_qs(url.query)
+        try:
+            since = parseTimestamp(params['since'][0]) if 'since' in params else None
+            until = parseTimestamp(params['until'][0], endOfDay = True) if 'until' in params else None
+        except ValueError as error:
+            self.sendError(400, "Invalid date: " + str(error))
+            return
+        languages = params['language'][0].split(',') if 'language' in params else ['total'] + countLanguages
+        categories = params['category'][0].split(',') if 'category' in params else ['Total'] + countCategories
+        for language in languages:
+            if language != 'total' and language not in countLanguages:
+                self.sendError(400, "Unknown language " + language)
+                return
+        for category in categories:
+            if category != 'Total' and category not in countCategories:
+                self.sendError(400, "Unknown category " + category)
+                return
+        history = self.history
+        try:
+            history.update()
+            body = history.query(history.head, since, until, tuple(languages), tuple(categories))
+        except Exception as error:
+            self.sendError(500, "Failed to count lines: " + str(error))
+            return
+        self.sendJson(200, body)
+
+def serveCounts(rootDir):
+    port = 8765
+    if len(sys.argv) > 3:
+        port = int(sys.argv[3])
+
+    history = CountHistory(rootDir)
+    print("Counting lines of " + rootDir + "...")
+    history.update()
+    CountRequestHandler.history = history
+
+    server = http.server.HTTPServer(('127.0.0.1', port), CountRequestHandler)
+    print("Serving line counts on http://127.0.0.1:" + str(port) + "/counts")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    history.close()
+
 rootDir = os.path.abspath(sys.argv[1])
 if len(sys.argv) > 2:
     if sys.argv[2] == "--historical":
         printHistoricalCount(rootDir)
+    elif sys.argv[2] == "--attribution":
+        printAttributionCount(rootDir)
+    elif sys.argv[2] == "--serve":
+        serveCounts(rootDir)
     else:
         print("Unknown option " + sys.argv[2])
 else:
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+#
+# Benchmark for the VGC 2022 to 2023 file converter.
+#
+# This script generates a reproducible synthetic illustration in the 2022
+# format, converts it with vgc-2022-to-2023-file-converter.py, and prints
+# the conversion throughput (elements/sec and MB/sec) as well as the peak
+# resident memory of the process.
+#
+# It also converts the same illustration with a frozen copy of the original
+# converter and checks that both outputs are byte-for-byte identical, so
+# that optimizations of the converter cannot silently change its results.
+#
+# Example usage:
+#
+#    python vgc-2022-to-2023-file-converter-benchmark.py --paths 100000 --points 50
+#
+# Use the --keep option to keep the generated *.vgci file, for example to
+# profile the converter on it directly.
+#
+
+from pathlib import Path
+import argparse
+import importlib.util
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Loads the converter script as a module. We cannot use a regular import
+# since its file name is not a valid Python module name.
+#
+def loadConverter():
+    converterPath = Path(__file__).with_name('vgc-2022-to-2023-file-converter.py')
+    spec = importlib.util.spec_from_file_location('vgcFileConverter', str(converterPath))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Reference implementation of the converter, as it was when this benchmark
+# was written. Do not optimize or otherwise modify these functions: they are
+# the ground truth that the output of the actual converter is compared to.
+#
+def referenceCreateVertex(parent, id, position):
+    vertex = ET.SubElement(parent, 'vertex')
+    vertex.set('id', f"v{id}")
+    vertex.set('position', position)
+
+def referenceGetStartAndEndPosition(path):
+    positionsString = path.get('positions')
+    positions = []
+    parenthesisOpened = False
+    position = ""
+    for c in positionsString:
+        if not parenthesisOpened:
+            if c == '(':
+                parenthesisOpened = True
+                position = '('
+        else:
+            position += c
+            if c == ')':
+                parenthesisOpened = False
+                positions.append(position)
+    if not positions:
+        return ('(0, 0)', '(0, 0)')
+    else:
+        return (positions[0], positions[-1])
+
+def referenceConvert2022to2023(root):
+    vertexId = 0
+    for path in root.findall('path'):
+        startVertexId = vertexId
+        endVertexId = vertexId + 1
+        vertexId += 2
+        (startPosition, endPosition) = referenceGetStartAndEndPosition(path)
+        referenceCreateVertex(root, startVertexId, startPosition)
+        referenceCreateVertex(root, endVertexId, endPosition)
+        path.set('startvertex', f"#v{startVertexId}")
+        path.set('endvertex', f"#v{endVertexId}")
+        path.tag = 'edge'
+
+def formatPoint(x, y):
+    return f"({x:.6g}, {y:.6g})"
+
+# Writes a synthetic illustration in the 2022 format to the given file.
+#
+# Each path is a random walk of `numPoints` points. With probability
+# `connectivity`, a path starts exactly where a previously generated path
+# ended, which mimics how strokes are connected in real illustrations.
+#
+# The file is streamed to disk instead of being built as an XML tree, so
+# that generating it does not inflate the peak memory of the benchmark.
+#
+def generateIllustration(filePath, numPaths, numPoints, connectivity, seed):
+    rng = random.Random(seed)
+    endPoints = []
+    with open(filePath, 'w', encoding='UTF-8') as f:
+        f.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        f.write('<vgc>\n')
+        for i in range(numPaths):
+            if endPoints and rng.random() < connectivity:
+                (x, y) = rng.choice(endPoints)
+            else:
+                x = rng.uniform(0, 1000)
+                y = rng.uniform(0, 1000)
+            positions = [formatPoint(x, y)]
+            widths = [f"{rng.uniform(1, 10):.6g}"]
+            for j in range(1, numPoints):
+                x += rng.uniform(-5, 5)
+                y += rng.uniform(-5, 5)
+                positions.append(formatPoint(x, y))
+                widths.append(f"{rng.uniform(1, 10):.6g}")
+            endPoints.append((x, y))
+            color = f"rgb({rng.randrange(256)}, {rng.randrange(256)}, {rng.randrange(256)})"
+            f.write(f'  <path positions="[{", ".join(positions)}]" widths="[{", ".join(widths)}]" color="{color}"/>\n')
+        f.write('</vgc>\n')
+
+# Returns the peak resident set size of this process in bytes, or None if
+# it cannot be determined on this platform.
+#
+def getPeakRss():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss       # bytes on macOS
+    else:
+        return maxrss * 1024 # kilobytes on Linux
+
+# Parses, converts, and serializes the given file with the given conversion
+# function. Returns the serialized output and the timings of each step.
+#
+def runConversion(convert, filePath):
+    t0 = time.perf_counter()
+    tree = ET.parse(str(filePath))
+    root = tree.getroot()
+    t1 = time.perf_counter()
+    convert(root)
+    t2 = time.perf_counter()
+    output = ET.tostring(root, encoding='UTF-8')
+    t3 = time.perf_counter()
+    return output, (t1 - t0, t2 - t1, t3 - t2)
+
+# Returns a human-readable description of the first difference between the
+# two given serialized outputs, or None if they are identical.
+#
+def diffOutputs(expected, actual):
+    if expected == actual:
+        return None
+    expectedLines = expected.split(b'>')
+    actualLines = actual.split(b'>')
+    for i, (e, a) in enumerate(zip(expectedLines, actualLines)):
+        if e != a:
+            return (f"element {i} differs:\n"
+                    f"  expected: {e.decode('utf8')}>\n"
+                    f"  actual:   {a.decode('utf8')}>")
+    return (f"outputs have a different number of elements: "
+            f"expected {len(expectedLines)}, got {len(actualLines)}")
+
+# Returns the (x, y) coordinates of a position string such as "(1.5, 2)",
+# or None if the string cannot be parsed. This is intentionally independent
+# from the converter's own parsing, which is part of what is checked.
+#
+def referenceParsePosition(position):
+    try:
+        (x, y) = position.strip('() ').split(',')
+        return (float(x), float(y))
+    except ValueError:
+        return None
+
+# Checks the output of a conversion with merged vertices, which cannot be
+# compared to the reference converter. Returns a human-readable description
+# of the first problem found, or None if there is none.
+#
+# Each edge must refer to existing vertices, and these vertices must be
+# within the tolerance of the first and last positions of the edge.
+#
+def checkMergedOutput(output, tolerance):
+    root = ET.fromstring(output)
+    positions = {}
+    for vertex in root.findall('vertex'):
+        positions[f"#{vertex.get('id')}"] = vertex.get('position')
+    for i, edge in enumerate(root.findall('edge')):
+        endpoints = referenceGetStartAndEndPosition(edge)
+        for (attribute, position) in zip(('startvertex', 'endvertex'), endpoints):
+            ref = edge.get(attribute)
+            if ref not in positions:
+                return f"edge {i} refers to a non-existing vertex: {attribute}=\"{ref}\""
+            vertexPosition = positions[ref]
+            if vertexPosition == position:
+                continue
+            xy = referenceParsePosition(position)
+            vxy = referenceParsePosition(vertexPosition)
+            if (xy is None or vxy is None or
+                    math.hypot(xy[0] - vxy[0], xy[1] - vxy[1]) > tolerance):
+                return (f"edge {i} has its {attribute} at {vertexPosition}, "
+                        f"which is too far from its endpoint at {position}")
+    return None
+
+def formatBytes(numBytes):
+    return f"{numBytes / (1024 * 1024):.1f} MB"
+
+# Script entry point.
+#
+if __name__ == "__main__":
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(
+        prog='vgc-2022-to-2023-file-converter-benchmark',
+        description="Benchmarks the VGC 2022 to 2023 file converter on a synthetic illustration.")
+    parser.add_argument('--paths', type=int, default=10000, help="number of paths in the generated illustration (default: 10000)")
+    parser.add_argument('--points', type=int, default=20, help="number of points per path, at least 1 (default: 20)")
+    parser.add_argument('--connectivity', type=float, default=0.5, help="probability that a path starts at the end of another path (default: 0.5)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed used to generate the illustration (default: 0)")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed conversions, at least 1, the best one is reported (default: 3)")
+    parser.add_argument('--no-check', action='store_true', help="skip the comparison against the reference converter")
+    parser.add_argument('-m', '--merge-vertices', action='store_true', help="benchmark the converter with vertex merging enabled")
+    parser.add_argument('-t', '--tolerance', type=float, help="maximum distance between merged endpoints (default: 0, implies -m)")
+    parser.add_argument('--keep', metavar='FILE', help="keep the generated illustration at the given path")
+    args = parser.parse_args()
+    if args.paths < 0:
+        parser.error("the number of paths must be positive or zero")
+    if args.points < 1:
+        parser.error("the number of points per path must be at least 1")
+    if args.repeat < 1:
+        parser.error("the number of timed conversions must be at least 1")
+    if args.tolerance is not None:
+        if not (math.isfinite(args.tolerance) and args.tolerance >= 0):
+            parser.error("the tolerance must be a finite number, positive or zero")
+        args.merge_vertices = True
+    else:
+        args.tolerance = 0
+
+    converter = loadConverter()
+    convert = lambda root: converter.convert2022to2023(root, args.merge_vertices, args.tolerance)
+
+    # Generate the illustration
+    if args.keep:
+        filePath = Path(args.keep)
+    else:
+        (fd, tmpName) = tempfile.mkstemp(suffix='.vgci')
+        os.close(fd)
+        filePath = Path(tmpName)
+    print(f"Generating {args.paths} paths with {args.points} points each...")
+    generateIllustration(filePath, args.paths, args.points, args.connectivity, args.seed)
+    fileSize = filePath.stat().st_size
+    print(f"Generated {filePath} ({formatBytes(fileSize)}).")
+
+    try:
+        # Timed conversions. We keep the best timings, which are the least
+        # affected by the noise of other processes running on the machine.
+        bestParse = bestConvert = bestWrite = float('inf')
+        output = None
+        for i in range(args.repeat):
+            output, (parseTime, convertTime, writeTime) = runConversion(convert, filePath)
+            bestParse = min(bestParse, parseTime)
+            bestConvert = min(bestConvert, convertTime)
+            bestWrite = min(bestWrite, writeTime)
+        peakRss = getPeakRss()
+        totalTime = bestParse + bestConvert + bestWrite
+
+        print(f"Parse:    {bestParse:.3f} s")
+        print(f"Convert:  {bestConvert:.3f} s ({args.paths / bestConvert:,.0f} paths/sec)")
+        print(f"Write:    {bestWrite:.3f} s")
+        print(f"Total:    {totalTime:.3f} s ({fileSize / (1024 * 1024) / totalTime:.1f} MB/sec)")
+        if peakRss is not None:
+            print(f"Peak RSS: {formatBytes(peakRss)}")
+        print(f"Vertices: {output.count(b'<vertex ')} for {args.paths} paths")
+
+        # Compare against the reference converter. When merging vertices,
+        # the output is expected to differ, so we only check that it is
+        # consistent with the input instead.
+        if args.no_check:
+            pass
+        elif args.merge_vertices:
+            problem = checkMergedOutput(output, args.tolerance)
+            if problem:
+                print(f"Error: invalid output with merged vertices: {problem}")
+                sys.exit(1)
+            print("Output with merged vertices is consistent with the input.")
+        else:
+            expected, _ = runConversion(referenceConvert2022to2023, filePath)
+            diff = diffOutputs(expected, output)
+            if diff:
+                print(f"Error: output differs from the reference converter: {diff}")
+                sys.exit(1)
+            print("Output identical to the reference converter.")
+    finally:
+        if not args.keep:
+            filePath.unlink()
@@ -17,9 +17,16 @@
 #
 # This will create a new file called 'my-file-converted.vgci' in the new format.
 #
+# By default, each path is converted to an edge with its own two vertices.
+# Use the -m option to make paths with coincident endpoints share the same
+# vertex, or the -t option to also merge endpoints which are close enough:
+#
+#    python vgc-2022-to-2023-file-converter.py -t 0.01 'C:\path\to\my-file.vgci'
+#
 
 from pathlib import Path
 import argparse
+import math
 import xml.etree.ElementTree as ET
 
 def createVertex(parent, id, position):
@@ -49,17 +56,110 @@ def getStartAndEndPosition(path):
     else:
         return (positions[0], positions[-1])
 
+# Returns the (x, y) coordinates of a position string such as "(1.5, 2)",
+# or None if the string cannot be parsed or is not a finite position.
+#
+def parsePosition(position):
+    try:
+        (x, y) = position.strip('() ').split(',')
+        (x, y) = (float(x), float(y))
+    except ValueError:
+        return None
+    if not (math.isfinite(x) and math.isfinite(y)):
+        return None
+    return (x, y)
+
+# Spatial index used to find whether a vertex already exists at a given
+# position, up to some tolerance.
+#
+# Vertices are stored in a uniform grid whose cell size is the tolerance,
+# so that any vertex within the tolerance of a given position is in the
+# same cell or one of its 8 neighbors. This makes each lookup run in
+# constant time on average, and the whole conversion in linear time.
+#
+# With a tolerance of zero, only vertices at the exact same position are
+# merged, which is done with a simple dictionary lookup.
+#
+class VertexIndex:
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.cells = {}             # (i, j) -> list of (x, y, id)
+        self.positions = {}         # (x, y) -> id, for exact matches
+        self.unparsedPositions = {} # position string -> id
+
+    # Returns the grid cell of the given position, or None if the cell
+    # indices are not finite, which happens when the tolerance is so small
+    # compared to the coordinates that x / tolerance overflows.
+    #
+    def cellOf(self, x, y):
+        (u, v) = (x / self.tolerance, y / self.tolerance)
+        if not (math.isfinite(u) and math.isfinite(v)):
+            return None
+        return (math.floor(u), math.floor(v))
+
+    # Returns the ID of an existing vertex within the tolerance of the
+    # given position, other than excludedId. If there is no such vertex,
+    # then the given newId is inserted at this position and returned.
+    #
+    def findOrInsert(self, position, newId, excludedId=None):
+        xy = parsePosition(position)
+        if xy is None:
+            return self.findOrInsertExact(self.unparsedPositions, position, newId, excludedId)
+        cell = self.cellOf(*xy) if self.tolerance > 0 else None
+        if cell is None:
+            return self.findOrInsertExact(self.positions, xy, newId, excludedId)
+        (x, y) = xy
+        (i, j) = cell
+        squaredTolerance = self.tolerance * self.tolerance
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for (vx, vy, id) in self.cells.get((i + di, j + dj), ()):
+                    if id != excludedId and (vx - x) ** 2 + (vy - y) ** 2 <= squaredTolerance:
+                        return id
+        self.cells.setdefault(cell, []).append((x, y, newId))
+        return newId
+
+    # Same as findOrInsert() for vertices only merged if at the exact same
+    # position, which is used as key of the given dictionary. If the vertex
+    # at this position is excluded, then newId is returned but not inserted,
+    # so that the existing vertex is still found by later queries.
+    #
+    def findOrInsertExact(self, positions, key, newId, excludedId):
+        id = positions.setdefault(key, newId)
+        return newId if id == excludedId else id
+
 # Convert an XML tree from 2022 to 2023 representation
 #
-def convert2022to2023(root):
+# By default, two new vertices are created for each path. If mergeVertices
+# is True, then path endpoints which are within the given tolerance of an
+# existing vertex are connected to this vertex instead of creating a new
+# one, which makes paths sharing endpoints topologically connected.
+#
+def convert2022to2023(root, mergeVertices=False, tolerance=0):
     vertexId = 0
+    index = VertexIndex(tolerance) if mergeVertices else None
+
+    def getOrCreateVertex(position, excludedId=None):
+        nonlocal vertexId
+        if index is not None:
+            id = index.findOrInsert(position, vertexId, excludedId)
+            if id != vertexId:
+                return id
+        id = vertexId
+        vertexId += 1
+        createVertex(root, id, position)
+        return id
+
     for path in root.findall('path'):
-        startVertexId = vertexId
-        endVertexId = vertexId + 1
-        vertexId += 2
         (startPosition, endPosition) = getStartAndEndPosition(path)
-        createVertex(root, startVertexId, startPosition)
-        createVertex(root, endVertexId, endPosition)
+        startVertexId = getOrCreateVertex(startPosition)
+
+        # Do not turn an open path into a closed one by merging its end into
+        # the vertex of its start, unless both positions are exactly equal.
+        startXY = parsePosition(startPosition)
+        isClosed = (startPosition == endPosition or
+                    (startXY is not None and startXY == parsePosition(endPosition)))
+        endVertexId = getOrCreateVertex(endPosition, None if isClosed else startVertexId)
         path.set('startvertex', f"#v{startVertexId}")
         path.set('endvertex', f"#v{endVertexId}")
         path.tag = 'edge'
@@ -74,7 +174,15 @@ if __name__ == "__main__":
         description="Converts VGC Illustration *.vgci files from the 2022 format to the 2023 format.")
     parser.add_argument('file', nargs='+', help="path to a *.vgci file to convert")
     parser.add_argument('-f', '--force', action='store_true', help="force overwrite of existing files")
+    parser.add_argument('-m', '--merge-vertices', action='store_true', help="use a single vertex for path endpoints at the same position")
+    parser.add_argument('-t', '--tolerance', type=float, help="maximum distance between merged endpoints (default: 0, implies -m)")
     args = parser.parse_args()
+    if args.tolerance is not None:
+        if not (math.isfinite(args.tolerance) and args.tolerance >= 0):
+            parser.error("the tolerance must be a finite number, positive or zero")
+        args.merge_vertices = True
+    else:
+        args.tolerance = 0
 
     # Iterate over files
     for f in args.file:
@@ -89,6 +197,6 @@ if __name__ == "__main__":
         print(f"Converting {inPath}...")
         tree = ET.parse(str(inPath))
         root = tree.getroot()
-        convert2022to2023(root)
+        convert2022to2023(root, args.merge_vertices, args.tolerance)
         tree.write(str(outPath), encoding='UTF-8', xml_declaration=True)
         print("Done.")